@@ -1,168 +1,308 @@
 from nornir import InitNornir
-from nornir_netmiko.tasks import netmiko_send_config, netmiko_send_command
 from nornir.core.inventory import ConnectionOptions
+from nornir.core.filter import F
+from nornir.plugins.runners import ThreadedRunner
 import time
 import getpass
-import difflib
 import os
+import sys
+import re
 import json
+import gzip
 import argparse
+import itertools
+import functools
 from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Prefer the Rust-backed drop-in for difflib when it is installed
+try:
+    from difflib_rs import unified_diff
+except ImportError:
+    import difflib
+    from difflib import unified_diff
+    
+    # cdifflib's C SequenceMatcher speeds up the stdlib diff when it is installed
+    try:
+        from cdifflib import CSequenceMatcher
+        difflib.SequenceMatcher = CSequenceMatcher
+    except ImportError:
+        pass
+
+# orjson is an optional, faster JSON encoder; stdlib json is used otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Upper bound on concurrent SSH sessions unless overridden by NORNIR_MAX_WORKERS
+DEFAULT_MAX_WORKERS = 100
+
+# Seconds between SSH keepalives so sessions survive the whole run
+SSH_KEEPALIVE = 30
+
+# Seconds allowed for each show command; a batched send gets the sum for its commands
+SHOW_READ_TIMEOUT = 60
+
+# Hosts where a batched send failed or was not honoured; later sends go one command at a time
+_UNBATCHED_HOSTS = set()
+
+# BAREMETAL port-profile definition pushed to every host
+PORT_PROFILE_CMDS = [
+    "port-profile type ethernet BAREMETAL",
+    "mtu 9000",
+    "no snmp trap link-status",
+    "spanning-tree port type edge trunk",
+    "state enabled",
+    "exit",
+]
+
+# Target interfaces Ethernet1/1-46 as interned strings, built once at import
+TARGET_INTERFACES = tuple(sys.intern(f"Ethernet1/{i}") for i in range(1, 47))
+TARGET_INTERFACE_SET = frozenset(TARGET_INTERFACES)
+
+# Per-interface inherit stanzas for each target interface
+_INTERFACE_STANZAS = {
+    interface: (f"interface {interface}", "inherit port-profile BAREMETAL", "exit")
+    for interface in TARGET_INTERFACES
+}
+
+# The block of comment lines at the top of a configuration
+_LEADING_COMMENTS_RE = re.compile(r'(?:[ \t]*!.*(?:\n|$))*')
+
+# Every line that is not a comment (leading whitespace then '!'), without its newline
+_CONFIG_TEXT_LINE_RE = re.compile(r'^(?![ \t]*!)(?=.|\n).*', re.M)
+
+# The BAREMETAL port-profile header plus its indented settings
+_PORT_PROFILE_RE = re.compile(r'^port-profile type ethernet BAREMETAL[ \t]*$((?:\n[ \t]+.*)*)', re.M)
+
+# Bits 1-46 set: one bit per target interface Ethernet1/1-46
+TARGET_MASK = (1 << 47) - 2
+
+# Marker echoed between batched show commands, and the pattern that splits on it
+SPLIT_MARKER = "===SPLIT==="
+_SPLIT_RE = re.compile(rf'^{SPLIT_MARKER}[ \t]*\r?\n?', re.M)
+
+# One pass over the config: each match is an Ethernet1/N header (num), another top-level
+# line (top), or an indented stanza line that marks L3 config (l3/routed) or a port-profile
+_CONFIG_LINE_RE = re.compile(
+    r'^(?:interface[ \t]+(?i:ethernet|eth)1/(?P<num>\d+)[ \t]*$'
+    r'|[ \t]+(?:(?P<l3>ip address|ipv6 address|no switchport)'
+    r'|(?P<routed>.*(?i:routed))'
+    r'|(?P<inherit>inherit port-profile\b))'
+    r'|(?P<top>\S))',
+    re.M
+)
 
 def condense_interface_ranges(interfaces):
     """Convert list of interfaces to condensed ranges (e.g., Ethernet1/1-5, Ethernet1/7-10)"""
     if not interfaces:
         return []
     
-    # Extract interface numbers and sort them
-    interface_nums = []
-    for interface in interfaces:
-        if interface.startswith('Ethernet1/'):
-            try:
-                num = int(interface.split('/')[-1])
-                interface_nums.append(num)
-            except ValueError:
-                continue
-    
-    interface_nums.sort()
+    # The same interface sets are condensed repeatedly across reports, so results are cached
+    ranges = _condense_interface_set(frozenset(interfaces))
     
-    if not interface_nums:
+    if not ranges:
         return interfaces  # Return original if we can't parse
     
-    # Group consecutive numbers into ranges
+    return list(ranges)
+
+@functools.lru_cache(maxsize=512)
+def _condense_interface_set(interface_set):
+    """Condense a frozenset of interface names into a tuple of range strings"""
+    # Extract unique interface numbers in one pass and sort them
+    interface_nums = sorted({
+        int(number)
+        for prefix, _, number in (interface.rpartition('/') for interface in interface_set)
+        if prefix == 'Ethernet1' and number.isdigit()
+    })
+    
+    # Consecutive numbers share the same (number - position) key, so each group is one range
     ranges = []
-    start = interface_nums[0]
-    end = start
-    
-    for i in range(1, len(interface_nums)):
-        if interface_nums[i] == end + 1:
-            end = interface_nums[i]
+    for _, group in itertools.groupby(enumerate(interface_nums), lambda pair: pair[1] - pair[0]):
+        block = [num for _, num in group]
+        if len(block) == 1:
+            ranges.append(f"Ethernet1/{block[0]}")
         else:
-            # End of consecutive sequence, add range
-            if start == end:
-                ranges.append(f"Ethernet1/{start}")
-            else:
-                ranges.append(f"Ethernet1/{start}-{end}")
-            start = interface_nums[i]
-            end = start
-    
-    # Add the last range
-    if start == end:
-        ranges.append(f"Ethernet1/{start}")
-    else:
-        ranges.append(f"Ethernet1/{start}-{end}")
+            ranges.append(f"Ethernet1/{block[0]}-{block[-1]}")
     
-    return ranges
+    return tuple(ranges)
+
+def get_connection(task):
+    """Get the host's persistent Netmiko connection (opened once, reused by every task)"""
+    return task.host.get_connection("netmiko", task.nornir.config)
 
-def get_running_config(task):
-    """Get running configuration from device"""
-    result = task.run(task=netmiko_send_command, command_string="show running-config")
-    return result.result
+def open_connection(task):
+    """Open the host's persistent Netmiko session ahead of the first phase"""
+    get_connection(task)
 
-def get_mac_table(task):
-    """Get MAC address table from device"""
+def _discard_pending_output(net_connect, error):
+    """Clear whatever a failed read left on the channel, re-raising that read's error if this fails too"""
     try:
-        result = task.run(task=netmiko_send_command, command_string="show mac address-table")
-        return result.result
-    except Exception as e:
-        print(f"Error getting MAC table for {task.host}: {e}")
-        return None
+        net_connect.clear_buffer()
+    except Exception:
+        raise error from None
+
+def fetch_all(task, commands, optional=()):
+    """Run several show commands in one CLI round-trip and split the output per command"""
+    net_connect = get_connection(task)
+    hostname = str(task.host)
+    
+    if len(commands) > 1 and hostname not in _UNBATCHED_HOSTS:
+        # NX-OS chains commands with ';'; an echoed marker line precedes each command's output
+        batched = " ; ".join(f"echo {SPLIT_MARKER} ; {command}" for command in commands)
+        try:
+            # The combined output takes as long as all of its commands together
+            output = net_connect.send_command(batched, read_timeout=SHOW_READ_TIMEOUT * len(commands))
+        except Exception as e:
+            # A failed batch does not say which command broke - send them one by one below
+            _UNBATCHED_HOSTS.add(hostname)
+            _discard_pending_output(net_connect, e)
+        else:
+            parts = _SPLIT_RE.split(output)[1:]
+            if len(parts) == len(commands):
+                return {command: part.strip('\n') for command, part in zip(commands, parts)}
+            
+            # Device did not honour the batch - later phases skip straight to single sends
+            _UNBATCHED_HOSTS.add(hostname)
+    
+    outputs = {}
+    for command in commands:
+        try:
+            outputs[command] = net_connect.send_command(command, read_timeout=SHOW_READ_TIMEOUT)
+        except Exception as e:
+            # Optional commands report None instead of failing the whole fetch
+            if command not in optional:
+                raise
+            _discard_pending_output(net_connect, e)
+            outputs[command] = None
+            print(f"Error running '{command}' on {hostname}: {e}")
+    return outputs
 
-def validate_interfaces(task):
-    """Validate port-profile inheritance and detect L3 interfaces to skip"""
+def get_device_state(task, include_mac=True):
+    """Capture running configuration and MAC address table, batched into one send when possible"""
+    commands = ["show running-config"]
+    if include_mac:
+        commands.append("show mac address-table")
+    
+    # A MAC table that cannot be read is reported as missing; the config read must succeed
+    outputs = fetch_all(task, commands, optional={"show mac address-table"})
+    return {
+        'config': outputs["show running-config"],
+        'mac': outputs.get("show mac address-table") or None,
+    }
+
+def port_profile_defined(config_text):
+    """Check whether the BAREMETAL port-profile already exists with all of its settings"""
+    match = _PORT_PROFILE_RE.search(config_text)
+    if not match:
+        return False
+    
+    settings = {line.strip() for line in match.group(1).splitlines()}
+    return all(cmd in settings for cmd in PORT_PROFILE_CMDS[1:-1])
+
+def _mask_to_interfaces(mask):
+    """Expand an interface bitmask (bit N = Ethernet1/N) into interface names in port order"""
+    return [interface for i, interface in enumerate(TARGET_INTERFACES, 1) if mask >> i & 1]
+
+class ValidationResult:
+    """Port-profile validation state for one host
+
+    Interface membership is kept as bitmasks (bit N = Ethernet1/N); the interface
+    lists used for reporting are expanded from the masks on access.
+    """
+    __slots__ = ('profile_mask', 'l3_mask', 'port_profile_defined', 'error')
+
+    def __init__(self, profile_mask=0, l3_mask=0, port_profile_defined=False, error=None):
+        self.profile_mask = profile_mask  # Any port-profile (BAREMETAL, BLOCKER, etc.)
+        self.l3_mask = l3_mask  # Interfaces with L3 configuration
+        self.port_profile_defined = port_profile_defined  # BAREMETAL definition already complete
+        self.error = error
+
+    @property
+    def missing_mask(self):
+        # L3 interfaces are skipped and counted as "handled"
+        if self.error:
+            return 0
+        return TARGET_MASK & ~(self.profile_mask | self.l3_mask)
+
+    @property
+    def port_profile_missing(self):
+        return _mask_to_interfaces(self.missing_mask)
+
+    @property
+    def port_profile_failed(self):
+        """Interfaces that failed to get the port-profile"""
+        return self.port_profile_missing
+
+    @property
+    def port_profile_already_applied(self):
+        """Interfaces that already have a port-profile (any inherited profile counts)"""
+        return _mask_to_interfaces(self.profile_mask & ~self.l3_mask)
+
+    @property
+    def l3_interfaces_skipped(self):
+        return _mask_to_interfaces(self.l3_mask)
+
+    @property
+    def port_profile_applied(self):
+        if self.error:
+            return 0
+        return len(TARGET_INTERFACES) - bin(self.missing_mask).count('1')
+
+    @property
+    def needs_change(self):
+        """Whether a readable host still needs configuring (missing interfaces or an incomplete profile)"""
+        return not self.error and (bool(self.missing_mask) or not self.port_profile_defined)
+
+    @property
+    def validation_passed(self):
+        # Overall validation status based only on port-profile configuration
+        return not self.error and not self.missing_mask
+
+def validate_interfaces_from_text(config_text):
+    """Validate port-profile inheritance and detect L3 interfaces from captured running-config text"""
     try:
-        # Get interface configuration to check port-profile inheritance
-        interface_config = task.run(task=netmiko_send_command, command_string="show running-config interface")
-        
-        validation_results = {
-            'port_profile_applied': 0,
-            'port_profile_missing': [],
-            'port_profile_already_applied': [],  # Track interfaces that already have port-profile
-            'port_profile_failed': [],  # Track which interfaces failed to get port-profile
-            'l3_interfaces_skipped': [],  # Track L3/router interfaces that are skipped
-            'validation_passed': True
-        }
-        
-        # Check port-profile inheritance and L3 configuration in config
-        config_lines = interface_config.result.split('\n')
-        current_interface = None
-        interfaces_with_profile = set()
-        interfaces_with_baremetal = set()
-        l3_interfaces = set()  # Interfaces with L3 configuration
+        # Scan each Ethernet1/N stanza once; bit N of a mask stands for Ethernet1/N
+        profile_mask = 0
+        l3_mask = 0
         
-        for line in config_lines:
-            line = line.strip()
-            if line.startswith('interface '):
-                # Extract interface name
-                interface_part = line.split()[1] if len(line.split()) > 1 else ''
-                if 'ethernet1/' in interface_part.lower() or 'eth1/' in interface_part.lower():
-                    # Normalize interface name
-                    current_interface = interface_part.replace('Eth1/', 'Ethernet1/')
-                    if current_interface.startswith('ethernet1/'):
-                        current_interface = current_interface.replace('ethernet1/', 'Ethernet1/')
-            elif current_interface and (
-                line.startswith('ip address') or 
-                line.startswith('ipv6 address') or
-                line.startswith('no switchport') or
-                'routed' in line.lower()
-            ):
-                # Detect L3/routed interfaces by IP address configuration or no switchport
-                l3_interfaces.add(current_interface)
-            elif line.startswith('inherit port-profile') and current_interface:
-                # Track any port-profile inheritance (BAREMETAL, BLOCKER, etc.)
-                interfaces_with_profile.add(current_interface)
-                # Specifically track BAREMETAL port-profile
-                if 'inherit port-profile BAREMETAL' in line:
-                    interfaces_with_baremetal.add(current_interface)
-        
-        # Check which target interfaces have BAREMETAL port-profile applied vs need it
-        for i in range(1, 47):
-            interface = f"Ethernet1/{i}"
-            if interface in l3_interfaces:
-                # Skip L3/routed interfaces - they should not have port-profiles
-                validation_results['l3_interfaces_skipped'].append(interface)
-                validation_results['port_profile_applied'] += 1  # Count as "handled" 
-            elif interface in interfaces_with_baremetal:
-                # Interface already has BAREMETAL port-profile
-                validation_results['port_profile_applied'] += 1
-                validation_results['port_profile_already_applied'].append(interface)
-            elif interface in interfaces_with_profile:
-                # Interface has a different port-profile (like BLOCKER) - should be skipped
-                validation_results['port_profile_applied'] += 1
-                validation_results['port_profile_already_applied'].append(interface)
+        current_bit = 0  # Bit of the Ethernet1/1-46 stanza being scanned, 0 outside one
+        for match in _CONFIG_LINE_RE.finditer(config_text):
+            kind = match.lastgroup
+            if kind == 'num':
+                number = int(match.group('num'))
+                current_bit = 1 << number if 1 <= number <= len(TARGET_INTERFACES) else 0
+            elif kind == 'top':
+                current_bit = 0
+            elif kind == 'inherit':
+                profile_mask |= current_bit
             else:
-                # Interface needs BAREMETAL port-profile
-                validation_results['port_profile_missing'].append(interface)
-                validation_results['port_profile_failed'].append(interface)
-        
-        # Overall validation status based only on port-profile configuration
-        if validation_results['port_profile_missing']:
-            validation_results['validation_passed'] = False
+                # Detect L3/routed interfaces by IP address configuration or no switchport
+                l3_mask |= current_bit
         
-        return validation_results
+        return ValidationResult(profile_mask, l3_mask, port_profile_defined(config_text))
         
     except Exception as e:
-        return {
-            'error': str(e),
-            'validation_passed': False
-        }
+        return ValidationResult(error=str(e))
 
 def analyze_config_failures(before_validation, after_validation, hostname):
     """Analyze which interfaces failed to get configuration applied"""
     if not before_validation or not after_validation:
         return None
     
-    before_missing = set(before_validation.get('port_profile_missing', []))
-    after_missing = set(after_validation.get('port_profile_missing', []))
+    before_missing = set(before_validation.port_profile_missing)
+    after_missing = set(after_validation.port_profile_missing)
     
     # Interfaces that should have been configured but still missing
-    still_missing = before_missing.intersection(after_missing)
+    still_missing = before_missing & after_missing
     
     # Interfaces that were successfully configured
-    successfully_configured = before_missing - after_missing
+    successfully_configured = before_missing - still_missing
     
     # New failures (shouldn't happen, but good to check)
-    new_failures = after_missing - before_missing
+    new_failures = after_missing - still_missing
     
     total_configured = len(successfully_configured)
     total_attempted = len(before_missing)
@@ -177,146 +317,171 @@ def analyze_config_failures(before_validation, after_validation, hostname):
         'total_target_interfaces': 46,
         'before_missing_count': len(before_missing),
         'after_missing_count': len(after_missing),
-        'successfully_configured': list(successfully_configured),
-        'still_missing': list(still_missing),
-        'new_failures': list(new_failures),
+        'successfully_configured': successfully_configured,
+        'still_missing': still_missing,
+        'new_failures': new_failures,
         'configuration_success_rate': f"{total_configured}/{total_attempted} ({success_percentage:.1f}%)"
     }
 
 def save_validation_results(results, hostname, timestamp, suffix):
     """Save validation results to file"""
-    validation_dir = "validations"
-    os.makedirs(validation_dir, exist_ok=True)
-    
-    device_dir = os.path.join(validation_dir, hostname)
+    # makedirs creates the parent validations/ directory along with the device directory
+    device_dir = os.path.join("validations", hostname)
     os.makedirs(device_dir, exist_ok=True)
     
     filename = os.path.join(device_dir, f"validation_{suffix}_{timestamp}.json")
     
-    with open(filename, 'w') as f:
-        json.dump(results, f, indent=2)
+    # Both encoders sort keys so the file is identical whichever one is installed
+    if orjson is not None:
+        data = orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+    else:
+        data = json.dumps(results, indent=2, sort_keys=True).encode()
+    Path(filename).write_bytes(data)
     
     return filename
 
-def filter_config_lines(config_text):
-    """Filter out comment lines starting with ! for meaningful comparison"""
+def configs_equivalent(before_config, after_config):
+    """Cheaply detect configs that are identical apart from their leading comment header"""
+    if before_config == after_config:
+        return True
+    
+    # NX-OS prefixes show running-config with !Command/!Time lines, so compare what follows
+    before_start = _LEADING_COMMENTS_RE.match(before_config).end()
+    after_start = _LEADING_COMMENTS_RE.match(after_config).end()
+    if len(before_config) - before_start != len(after_config) - after_start:
+        return False
+    return before_config[before_start:] == after_config[after_start:]
+
+def split_config_lines(config_text):
+    """Split the configuration into lines, dropping comment lines starting with !"""
     if not config_text:
-        return ""
-    
-    lines = config_text.split('\n')
-    filtered_lines = []
-    
-    for line in lines:
-        # Skip lines starting with ! (comments/timestamps)
-        if not line.strip().startswith('!'):
-            filtered_lines.append(line)
-    
-    return '\n'.join(filtered_lines)
+        return []
+    return _CONFIG_TEXT_LINE_RE.findall(config_text)
 
-def create_diff(before_config, after_config, hostname):
-    """Create diff between before and after configurations, ignoring comment lines"""
-    # Filter out comment lines starting with !
-    before_filtered = filter_config_lines(before_config)
-    after_filtered = filter_config_lines(after_config)
-    
+def create_diff_from_lines(before_lines, after_lines, hostname):
+    """Create a streamed diff from configuration lines already filtered by split_config_lines"""
     # If filtered configs are identical, no meaningful changes
-    if before_filtered == after_filtered:
+    if before_lines is after_lines or before_lines == after_lines:
         return None
     
-    before_lines = before_filtered.splitlines(keepends=True)
-    after_lines = after_filtered.splitlines(keepends=True)
-    
-    diff = list(difflib.unified_diff(
-        before_lines, 
-        after_lines, 
+    diff = unified_diff(
+        before_lines,
+        after_lines,
         fromfile=f"{hostname}_before.cfg",
         tofile=f"{hostname}_after.cfg",
         lineterm=""
-    ))
+    )
     
-    return ''.join(diff)
+    return (line + '\n' for line in diff)
 
 def create_table_diff(before_table, after_table, hostname, table_type):
-    """Create diff between before and after tables (MAC)"""
+    """Create a streamed diff between before and after tables (MAC), or None when either was not captured"""
     if not before_table or not after_table:
         return None
-        
-    before_lines = before_table.splitlines(keepends=True)
-    after_lines = after_table.splitlines(keepends=True)
     
-    diff = list(difflib.unified_diff(
-        before_lines, 
-        after_lines, 
+    diff = unified_diff(
+        before_table.splitlines(),
+        after_table.splitlines(),
         fromfile=f"{hostname}_{table_type}_before.txt",
         tofile=f"{hostname}_{table_type}_after.txt",
         lineterm=""
-    ))
-    
-    return ''.join(diff)
-
-def configure_port_profile(task):
-    cmds = [
-        "port-profile type ethernet BAREMETAL",
-        "mtu 9000",
-        "no snmp trap link-status",
-        "spanning-tree port type edge trunk",
-        "state enabled",
-        "exit",
-    ]
-    task.run(task=netmiko_send_config, config_commands=cmds)
-
-def configure_interfaces(task, missing_interfaces=None):
-    """Configure only the interfaces that need port-profile applied"""
-    if not missing_interfaces:
-        # Fallback to all interfaces if no specific list provided
-        missing_interfaces = [f"Ethernet1/{i}" for i in range(1, 47)]
-    
-    cmds = []
-    for interface in missing_interfaces:
-        cmds.append(f"interface {interface}")
-        cmds.append("inherit port-profile BAREMETAL")
-        cmds.append("exit")
-    task.run(task=netmiko_send_config, config_commands=cmds)
-
-def create_condensed_diff(before_config, after_config, hostname):
-    """Create a condensed summary of configuration changes"""
-    # Filter out comment lines starting with !
-    before_filtered = filter_config_lines(before_config)
-    after_filtered = filter_config_lines(after_config)
+    )
     
-    # If filtered configs are identical, no meaningful changes
-    if before_filtered == after_filtered:
-        return None
-    
-    before_lines = before_filtered.splitlines()
-    after_lines = after_filtered.splitlines()
+    return (line + '\n' for line in diff)
+
+def write_diff_lines(filename, diff_lines):
+    """Stream newline-terminated diff lines to a gzip file as they are produced"""
+    # Level 1 is cheap enough that the smaller write usually outweighs it
+    with gzip.open(filename, 'wt', compresslevel=1) as f:
+        f.writelines(diff_lines)
+
+def build_host_diffs(job):
+    """Compute one host's diffs and write them to its diff directory (runs in a worker process)"""
+    (hostname, before_config, after_config, before_mac, after_mac,
+     config_diff_filename, mac_diff_filename) = job
+    
+    if configs_equivalent(before_config, after_config):
+        # No meaningful change - skip splitting the configs at all
+        diff_lines = condensed_diff = None
+    else:
+        # Filter and split each config once and share the lines between both config diffs
+        before_lines = split_config_lines(before_config)
+        after_lines = split_config_lines(after_config)
+        
+        # Files are streamed from here so only the short summary is pickled back
+        diff_lines = create_diff_from_lines(before_lines, after_lines, hostname)
+        condensed_diff = create_condensed_diff_from_lines(before_lines, after_lines, hostname)
+    mac_diff_lines = create_table_diff(before_mac, after_mac, hostname, "mac")
+    # Peek at the MAC diff - tables that match line for line produce no file
+    mac_first_line = None if mac_diff_lines is None else next(mac_diff_lines, None)
+    
+    if diff_lines or mac_first_line:
+        # Both files share the host's directory, so it is created once
+        os.makedirs(os.path.dirname(config_diff_filename), exist_ok=True)
+    if diff_lines:
+        write_diff_lines(config_diff_filename, diff_lines)
+    if mac_first_line:
+        write_diff_lines(mac_diff_filename, itertools.chain((mac_first_line,), mac_diff_lines))
     
-    # Create the full diff for analysis
-    diff = list(difflib.unified_diff(
-        before_lines, 
-        after_lines, 
-        fromfile=f"{hostname}_before.cfg",
-        tofile=f"{hostname}_after.cfg",
-        lineterm=""
-    ))
+    return {
+        'config_diff_written': diff_lines is not None,
+        'condensed_diff': condensed_diff,
+        'mac_diff_written': None if mac_diff_lines is None else mac_first_line is not None,
+    }
+
+def configure_all(task, missing_interfaces, include_profile=True):
+    """Configure the port-profile and apply it to interfaces in a single config session"""
+    interface_cmds = [cmd for interface in missing_interfaces for cmd in _INTERFACE_STANZAS[interface]]
     
-    # Analyze the diff to create a condensed summary
-    added_port_profiles = []
-    added_interfaces = []
-    other_changes = []
+    cmds = (PORT_PROFILE_CMDS if include_profile else []) + interface_cmds
+    if not cmds:
+        # Nothing to push - don't enter config mode at all
+        return None
+    net_connect = get_connection(task)
+    return net_connect.send_config_set(cmds)
+
+def configure_and_capture(task, missing_interfaces, include_profile=True):
+    """Configure a host, then capture its post-change state on the same connection"""
+    # A configuration error is recorded rather than raised so the final state is still
+    # captured for validation and diffs, as it was when these were separate runs
+    try:
+        configure_all(task, missing_interfaces, include_profile)
+        config_error = None
+    except Exception as e:
+        config_error = str(e)
     
+    state = get_device_state(task)
+    state['config_error'] = config_error
+    return state
+
+def _interface_config_lines(lines):
+    """Yield (interface, stripped line) for every indented line inside an interface stanza"""
     current_interface = None
-    for line in diff:
-        if line.startswith('+') and not line.startswith('+++'):
-            content = line[1:].strip()
-            if content.startswith('port-profile type ethernet BAREMETAL'):
-                added_port_profiles.append("BAREMETAL port-profile")
-            elif content.startswith('interface Ethernet1/'):
-                current_interface = content.split()[1]
-            elif content.startswith('inherit port-profile BAREMETAL') and current_interface:
-                added_interfaces.append(current_interface)
-            elif content and not content.startswith('interface') and 'port-profile' not in content:
-                other_changes.append(content)
+    for line in lines:
+        if not line[:1].isspace():
+            # Any top-level line starts a new block; only interface headers open a stanza
+            fields = line.split()
+            current_interface = fields[1] if len(fields) > 1 and fields[0] == 'interface' else None
+        elif current_interface:
+            yield current_interface, line.strip()
+
+def create_condensed_diff_from_lines(before_lines, after_lines, hostname):
+    """Create a condensed summary from configuration lines already filtered by split_config_lines"""
+    # If filtered configs are identical, no meaningful changes
+    if before_lines is after_lines or before_lines == after_lines:
+        return None
+    
+    # Only added inherit lines matter for the summary, so a set difference of
+    # (interface, line) pairs replaces a second full diff - one linear pass per side
+    before_pairs = set(_interface_config_lines(before_lines))
+    
+    added_interfaces = [
+        interface
+        for interface, content in _interface_config_lines(after_lines)
+        if interface in TARGET_INTERFACE_SET
+        and content.startswith('inherit port-profile BAREMETAL')
+        and (interface, content) not in before_pairs
+    ]
     
     # Create condensed summary - minimal and focused
     summary_lines = []
@@ -331,53 +496,66 @@ def create_condensed_diff(before_config, after_config, hostname):
     
     return '\n'.join(summary_lines)
 
-def main():
-    # Parse command line arguments
-    parser = argparse.ArgumentParser(description='Configure port profiles on network devices')
-    parser.add_argument('--dry-run', action='store_true', 
-                       help='Perform validation and show what would be configured without making changes')
-    args = parser.parse_args()
+def run_workflow(nr, dry_run, force=False):
+    """Run validation, configuration and change tracking over the persistent host connections"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
-    dry_run = args.dry_run
+    print("="*60)
+    print("Opening SSH sessions...")
     
-    if dry_run:
-        print("="*60)
-        print("DRY RUN MODE - No actual changes will be made")
-        print("="*60)
+    # Establish every session up front; later phases reuse them until main() closes them
+    start = time.time()
+    connect_result = nr.run(task=open_connection)
+    elapsed = time.time() - start
+    for host, host_result in connect_result.items():
+        if host_result.failed:
+            print(f"[{host}] FAILED to connect: {host_result.exception}")
+    print(f"SSH sessions opened in {elapsed:.2f} seconds.")
     
-    nr = InitNornir(config_file="config.yaml")
-
-    # Prompt for SSH credentials
-    username = input("SSH Username: ")
-    password = getpass.getpass("SSH Password: ")
-
-    # Inject credentials and platform/device_type into each host
-    for host in nr.inventory.hosts.values():
-        host.username = username
-        host.password = password
-        host.platform = "nxos"
-        host.connection_options["netmiko"] = ConnectionOptions(
-            extras={"device_type": "cisco_nxos"}
-        )
-
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    print("="*60)
+    print("Capturing initial configurations and tables...")
     
+    # Get configuration before changes
+    before_configs = {}
+    before_mac_tables = {}
+    
+    # Config and MAC table are captured in one task per host (MAC skipped on dry run to save time)
+    start = time.time()
+    before_result = nr.run(task=get_device_state, include_mac=not dry_run)
+    elapsed = time.time() - start
+    
+    for hostname, result in before_result.items():
+        if not result.failed:
+            before_configs[hostname] = result.result['config']
+            print(f"[{hostname}] Before config captured")
+            if not dry_run:
+                if result.result['mac']:
+                    before_mac_tables[hostname] = result.result['mac']
+                    print(f"[{hostname}] Before MAC table captured")
+                else:
+                    print(f"[{hostname}] FAILED to get MAC table or no data")
+        else:
+            print(f"[{hostname}] FAILED to get initial config: {result.exception}")
+    
+    if not dry_run:
+        print(f"\nInitial data capture completed in {elapsed:.2f} seconds.")
+    else:
+        print(f"\nInitial configuration capture completed in {elapsed:.2f} seconds.")
     print("="*60)
     print("Running pre-change validations...")
     
-    # Pre-change validations - no JSON saving
-    pre_validation_results = nr.run(task=validate_interfaces)
+    # Pre-change validations are derived from the captured running-config - no JSON saving
     pre_validation_data = {}
     
-    for hostname, result in pre_validation_results.items():
+    for hostname, result in before_result.items():
         if not result.failed:
-            validation_data = result.result
+            validation_data = validate_interfaces_from_text(result.result['config'])
             pre_validation_data[hostname] = validation_data
             
-            missing_count = len(validation_data.get('port_profile_missing', []))
-            applied_count = validation_data.get('port_profile_applied', 0)
-            already_applied = validation_data.get('port_profile_already_applied', [])
-            l3_skipped = validation_data.get('l3_interfaces_skipped', [])
+            missing_count = len(validation_data.port_profile_missing)
+            applied_count = validation_data.port_profile_applied
+            already_applied = validation_data.port_profile_already_applied
+            l3_skipped = validation_data.l3_interfaces_skipped
             
             # Enhanced summary with details
             if missing_count == 0:
@@ -402,7 +580,7 @@ def main():
                     print(f"      {range_str}")
             
             # Show interfaces that need configuration
-            missing_interfaces = validation_data.get('port_profile_missing', [])
+            missing_interfaces = validation_data.port_profile_missing
             if missing_interfaces:
                 print(f"    Need configuration: {len(missing_interfaces)} interfaces")
                 # Show condensed interface ranges
@@ -410,69 +588,35 @@ def main():
                 for range_str in condensed_missing:
                     print(f"      {range_str}")
                 
-            if validation_data.get('error'):
-                print(f"    - Error: {validation_data['error']}")
+            if validation_data.error:
+                print(f"    - Error: {validation_data.error}")
         else:
+            # Without a readable pre-change config the host must not be configured blindly
+            pre_validation_data[hostname] = ValidationResult(error=str(result.exception))
             print(f"[{hostname}] ✗ Validation failed: {result.exception}")
-
-    print("="*60)
-    print("Capturing initial configurations and tables...")
-    
-    # Get configuration before changes
-    before_configs = {}
-    before_mac_tables = {}
-    
-    start = time.time()
-    before_result = nr.run(task=get_running_config)
-    elapsed = time.time() - start
-    
-    for hostname, result in before_result.items():
-        if not result.failed:
-            before_configs[hostname] = result.result
-            print(f"[{hostname}] Before config captured")
-        else:
-            print(f"[{hostname}] FAILED to get initial config: {result.exception}")
-    
-    # Get MAC address tables before changes (only if not dry run to save time)
-    if not dry_run:
-        print("Capturing MAC address tables...")
-        start = time.time()
-        mac_result = nr.run(task=get_mac_table)
-        elapsed_mac = time.time() - start
-        
-        for hostname, result in mac_result.items():
-            if not result.failed and result.result:
-                before_mac_tables[hostname] = result.result
-                print(f"[{hostname}] Before MAC table captured")
-            else:
-                print(f"[{hostname}] FAILED to get MAC table or no data")
-        
-        print(f"\nInitial data capture completed in {elapsed + elapsed_mac:.2f} seconds.")
-    else:
-        print(f"\nInitial configuration capture completed in {elapsed:.2f} seconds.")
     print("="*60)
 
     if dry_run:
-        print("DRY RUN: Would configure port-profile with commands:")
-        print("  - port-profile type ethernet BAREMETAL")
-        print("  - mtu 9000")
-        print("  - no snmp trap link-status")
-        print("  - spanning-tree port type edge trunk")
-        print("  - state enabled")
-        print("  - exit")
-        print("\nDRY RUN: Would apply port-profile to interfaces Ethernet1/1 through Ethernet1/46")
+        print("DRY RUN: Would define the port-profile, where missing or incomplete, with commands:")
+        for cmd in PORT_PROFILE_CMDS:
+            print(f"  - {cmd}")
+        print("\nDRY RUN: Would apply port-profile to the interfaces in each host's plan below")
         print("="*60)
         print("DRY RUN CONFIGURATION PLAN:")
         print("="*60)
         
         # Show detailed plan based on pre-validation
         for hostname, validation_data in pre_validation_data.items():
-            missing_interfaces = validation_data.get('port_profile_missing', [])
-            already_applied = validation_data.get('port_profile_already_applied', [])
-            l3_skipped = validation_data.get('l3_interfaces_skipped', [])
+            missing_interfaces = validation_data.port_profile_missing
+            already_applied = validation_data.port_profile_already_applied
+            l3_skipped = validation_data.l3_interfaces_skipped
             
             print(f"\n[{hostname}] Configuration Plan:")
             
+            if validation_data.error:
+                print("  SKIP: configuration could not be read - device will not be configured")
+                continue
+            
             # Show L3 interfaces that would be skipped
             if l3_skipped:
                 print(f"  SKIP: {len(l3_skipped)} L3/router interfaces (auto-detected)")
@@ -487,13 +631,22 @@ def main():
                 for range_str in condensed_applied:
                     print(f"    {range_str}")
             
+            # Show whether the port-profile definition itself would be pushed
+            profile_defined = validation_data.port_profile_defined
+            if force:
+                print("  CONFIGURE: BAREMETAL port-profile definition re-pushed (--force)")
+            elif profile_defined:
+                print("  SKIP: BAREMETAL port-profile already defined")
+            else:
+                print("  CONFIGURE: BAREMETAL port-profile definition missing or incomplete")
+            
             # Show interfaces that would be configured
             if missing_interfaces:
                 print(f"  CONFIGURE: {len(missing_interfaces)} interfaces need port-profile")
                 condensed_missing = condense_interface_ranges(missing_interfaces)
                 for range_str in condensed_missing:
                     print(f"    {range_str}")
-            else:
+            elif profile_defined and not force:
                 print(f"  ✓ No configuration needed - all port-profiles already applied")
         
         print("\n" + "="*60)
@@ -501,58 +654,72 @@ def main():
         print("="*60)
         return
     
-    print("Configuring port-profile...")
-    start = time.time()
-    result1 = nr.run(task=configure_port_profile)
-    elapsed = time.time() - start
-    for host in result1.keys():
-        if result1[host].failed:
-            print(f"[{host}] FAILED: {result1[host].exception}")
+    # Hosts whose pre-change config could not be read are never configured; --force also
+    # takes readable hosts that are already compliant
+    unreadable_hosts = [hostname for hostname, validation_data in pre_validation_data.items() if validation_data.error]
+    hosts_needing_change = [
+        hostname for hostname, validation_data in pre_validation_data.items()
+        if validation_data.needs_change or (force and not validation_data.error)
+    ]
+    compliant_count = len(pre_validation_data) - len(unreadable_hosts) - len(hosts_needing_change)
+    
+    if unreadable_hosts:
+        print(f"Skipping {len(unreadable_hosts)} device(s) whose configuration could not be read: {', '.join(unreadable_hosts)}")
+    if compliant_count:
+        print(f"Skipping {compliant_count} already compliant device(s)")
+    if not hosts_needing_change:
+        if not unreadable_hosts:
+            print("All devices already compliant — skipping configuration and post-validation")
         else:
-            print(f"[{host}] DONE")
-    print(f"\nPort-profile configuration completed in {elapsed:.2f} seconds.")
-    print("="*60)
-
-    print("Applying port-profile to interfaces...")
+            print("No readable device needs changes — skipping configuration and post-validation")
+        print("="*60)
+        return
+    if len(hosts_needing_change) < len(nr.inventory.hosts):
+        nr = nr.filter(F(name__in=hosts_needing_change))
+    
+    print("Configuring port-profile, applying it to interfaces and capturing final state...")
     start = time.time()
     
-    # Create a custom task that passes missing interfaces to each host
-    def configure_interfaces_for_host(task):
+    # Create a custom task that passes missing interfaces to each host; each host captures
+    # its post-change state as soon as it is configured instead of waiting for the others
+    def configure_all_for_host(task):
         hostname = str(task.host)
-        if hostname in pre_validation_data:
-            missing_interfaces = pre_validation_data[hostname].get('port_profile_missing', [])
-            if missing_interfaces:
-                print(f"[{hostname}] Configuring {len(missing_interfaces)} interfaces")
-                configure_interfaces(task, missing_interfaces)
-            else:
-                print(f"[{hostname}] No interfaces need configuration - skipping")
+        validation_data = pre_validation_data.get(hostname)
+        if validation_data is None or validation_data.error:
+            raise RuntimeError("pre-change configuration could not be read - host not configured")
+        missing_interfaces = validation_data.port_profile_missing
+        # The port-profile definition is only pushed when it is absent or incomplete, or forced
+        include_profile = force or not validation_data.port_profile_defined
+        if missing_interfaces:
+            print(f"[{hostname}] Configuring {len(missing_interfaces)} interfaces")
+        elif include_profile:
+            print(f"[{hostname}] No interfaces need configuration - port-profile only")
         else:
-            # Fallback to original behavior if no pre-validation data
-            configure_interfaces(task)
+            print(f"[{hostname}] Port-profile already defined and no interfaces need configuration - skipping")
+        return configure_and_capture(task, missing_interfaces, include_profile)
     
-    result2 = nr.run(task=configure_interfaces_for_host)
+    after_result = nr.run(task=configure_all_for_host)
     elapsed = time.time() - start
-    for host in result2.keys():
-        if result2[host].failed:
-            print(f"[{host}] FAILED: {result2[host].exception}")
+    for host, host_result in after_result.items():
+        if host_result.failed:
+            print(f"[{host}] FAILED: {host_result.exception}")
+        elif host_result.result['config_error']:
+            print(f"[{host}] FAILED: {host_result.result['config_error']}")
         else:
             print(f"[{host}] DONE")
-    print(f"\nInterface configuration completed in {elapsed:.2f} seconds.")
+    print(f"\nConfiguration and final data capture completed in {elapsed:.2f} seconds.")
     print("="*60)
-
     print("Running post-change validations...")
     
-    # Post-change validations - no file saving
-    post_validation_results = nr.run(task=validate_interfaces)
-    
-    for hostname, result in post_validation_results.items():
+    # Post-change validations are derived from the captured running-config - no file saving
+    for hostname, result in after_result.items():
         if not result.failed:
-            validation_data = result.result
+            validation_data = validate_interfaces_from_text(result.result['config'])
             
-            missing_count = len(validation_data.get('port_profile_missing', []))
-            applied_count = validation_data.get('port_profile_applied', 0)
-            already_applied = validation_data.get('port_profile_already_applied', [])
-            l3_skipped = validation_data.get('l3_interfaces_skipped', [])
+            missing_count = len(validation_data.port_profile_missing)
+            applied_count = validation_data.port_profile_applied
+            already_applied = validation_data.port_profile_already_applied
+            l3_skipped = validation_data.l3_interfaces_skipped
             
             # Enhanced summary with details (matching pre-validation format)
             if missing_count == 0:
@@ -578,7 +745,7 @@ def main():
                 
                 # Show breakdown of what was newly configured vs already configured
                 if hostname in pre_validation_data:
-                    pre_already_applied = set(pre_validation_data[hostname].get('port_profile_already_applied', []))
+                    pre_already_applied = set(pre_validation_data[hostname].port_profile_already_applied)
                     post_already_applied = set(already_applied)
                     newly_configured = post_already_applied - pre_already_applied
                     was_already_configured = pre_already_applied.intersection(post_already_applied)
@@ -596,7 +763,7 @@ def main():
                             print(f"        {range_str}")
             
             # Show interfaces that still need configuration (if any)
-            missing_interfaces = validation_data.get('port_profile_missing', [])
+            missing_interfaces = validation_data.port_profile_missing
             if missing_interfaces:
                 print(f"    Still missing configuration: {len(missing_interfaces)} interfaces")
                 # Show condensed interface ranges
@@ -611,90 +778,115 @@ def main():
                     success_rate = failure_analysis['configuration_success_rate']
                     print(f"    Configuration success rate: {success_rate}")
                 
-            if validation_data.get('error'):
-                print(f"    - Error: {validation_data['error']}")
+            if validation_data.error:
+                print(f"    - Error: {validation_data.error}")
         else:
             print(f"[{hostname}] ✗ Post-validation failed: {result.exception}")
 
     print("="*60)
-    print("Capturing final configurations and tables...")
-    
-    # Get configuration after changes
-    start = time.time()
-    after_result = nr.run(task=get_running_config)
-    elapsed = time.time() - start
+    print("Creating configuration and MAC table diffs...")
     
-    # Get MAC address tables after changes
-    print("Capturing final MAC address tables...")
-    after_mac_result = nr.run(task=get_mac_table)
+    # SSH sessions are not needed past this point; closing them before the diff workers
+    # are forked keeps paramiko's transport threads (and their locks) out of the children
+    nr.close_connections(on_failed=True)
     
-    # Create main diffs directory only if needed
     main_diff_dir = "diffs"
-    diff_created = False
     
-    # Process configuration diffs
+    # Collect per-host diff jobs; diffing and writing are farmed out to worker processes
+    jobs = []
     for hostname, result in after_result.items():
         if not result.failed and hostname in before_configs:
-            after_config = result.result
             print(f"[{hostname}] After config captured")
-            
-            # Create and save config diff
-            diff_content = create_diff(before_configs[hostname], after_config, hostname)
-            condensed_diff = create_condensed_diff(before_configs[hostname], after_config, hostname)
-            
-            if diff_content:
-                # Only create directories when we have actual diffs
-                if not diff_created:
-                    os.makedirs(main_diff_dir, exist_ok=True)
-                    diff_created = True
-                
-                device_dir = os.path.join(main_diff_dir, hostname)
-                os.makedirs(device_dir, exist_ok=True)
-                
-                # Save detailed diff
-                diff_filename = os.path.join(device_dir, f"config_diff_detailed_{timestamp}.txt")
-                with open(diff_filename, 'w') as f:
-                    f.write(diff_content)
-                print(f"[{hostname}] Detailed configuration diff saved to {diff_filename}")
-                
-                # Display brief summary in console (only if meaningful)
-                if condensed_diff:
-                    print(f"{condensed_diff}")
-            else:
-                print(f"[{hostname}] No meaningful configuration changes detected")
+            device_dir = os.path.join(main_diff_dir, hostname)
+            jobs.append((
+                hostname,
+                before_configs[hostname],
+                result.result['config'],
+                before_mac_tables.get(hostname),
+                result.result['mac'],
+                os.path.join(device_dir, f"config_diff_detailed_{timestamp}.txt.gz"),
+                os.path.join(device_dir, f"mac_diff_{timestamp}.txt.gz"),
+            ))
         else:
             if result.failed:
                 print(f"[{hostname}] FAILED to get final config: {result.exception}")
             else:
                 print(f"[{hostname}] No initial config available for comparison")
     
-    # Process MAC table diffs
-    for hostname, result in after_mac_result.items():
-        if not result.failed and result.result and hostname in before_mac_tables:
-            after_mac = result.result
-            print(f"[{hostname}] After MAC table captured")
+    # Diffing is CPU-bound pure Python, so spread hosts across CPU cores
+    # and report each host as soon as its diff is ready
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        futures = {executor.submit(build_host_diffs, job): job for job in jobs}
+        for future in as_completed(futures):
+            hostname, *_, config_diff_filename, mac_diff_filename = futures[future]
+            diffs = future.result()
             
-            # Create MAC table diff
-            mac_diff = create_table_diff(before_mac_tables[hostname], after_mac, hostname, "mac")
-            if mac_diff:
-                # Only create directories when we have actual MAC diffs
-                if not diff_created:
-                    os.makedirs(main_diff_dir, exist_ok=True)
-                    diff_created = True
-                
-                device_dir = os.path.join(main_diff_dir, hostname)
-                os.makedirs(device_dir, exist_ok=True)
-                
-                mac_diff_filename = os.path.join(device_dir, f"mac_diff_{timestamp}.txt")
-                with open(mac_diff_filename, 'w') as f:
-                    f.write(mac_diff)
-                print(f"[{hostname}] MAC table diff saved to {mac_diff_filename}")
+            # Process configuration diff
+            if diffs['config_diff_written']:
+                # Display brief summary in console (only if meaningful)
+                if diffs['condensed_diff']:
+                    print(f"{diffs['condensed_diff']}")
+                print(f"[{hostname}] Detailed configuration diff saved to {config_diff_filename}")
             else:
-                print(f"[{hostname}] No MAC table changes detected")
+                print(f"[{hostname}] No meaningful configuration changes detected")
+            
+            # Process MAC table diff (None when either table was not captured)
+            if diffs['mac_diff_written'] is not None:
+                print(f"[{hostname}] After MAC table captured")
+                if diffs['mac_diff_written']:
+                    print(f"[{hostname}] MAC table diff saved to {mac_diff_filename}")
+                else:
+                    print(f"[{hostname}] No MAC table changes detected")
     
     print(f"\nFinal data capture and diff creation completed.")
     print("="*60)
     print("Configuration changes completed!")
 
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description='Configure port profiles on network devices')
+    parser.add_argument('--dry-run', action='store_true', 
+                       help='Perform validation and show what would be configured without making changes')
+    parser.add_argument('--force', action='store_true',
+                       help='Re-push the port-profile definition and re-validate devices that are already compliant')
+    args = parser.parse_args()
+    
+    dry_run = args.dry_run
+    
+    if dry_run:
+        print("="*60)
+        print("DRY RUN MODE - No actual changes will be made")
+        print("="*60)
+    
+    nr = InitNornir(config_file="config.yaml")
+    
+    # One worker per host (SSH-bound work), capped so ops can throttle via NORNIR_MAX_WORKERS
+    try:
+        max_workers = int(os.environ.get("NORNIR_MAX_WORKERS", DEFAULT_MAX_WORKERS))
+    except ValueError:
+        parser.error(f"NORNIR_MAX_WORKERS must be a whole number, got {os.environ['NORNIR_MAX_WORKERS']!r}")
+    num_workers = max(1, min(len(nr.inventory.hosts), max_workers))
+    nr = nr.with_runner(ThreadedRunner(num_workers=num_workers))
+
+    # Prompt for SSH credentials
+    username = input("SSH Username: ")
+    password = getpass.getpass("SSH Password: ")
+
+    # Inject credentials and platform/device_type into each host
+    for host in nr.inventory.hosts.values():
+        host.username = username
+        host.password = password
+        host.platform = "nxos"
+        host.connection_options["netmiko"] = ConnectionOptions(
+            # keepalive stops idle sessions being dropped between phases
+            extras={"device_type": "cisco_nxos", "keepalive": SSH_KEEPALIVE}
+        )
+
+    # Keep each host's SSH session open across every phase and close once at the end
+    try:
+        run_workflow(nr, dry_run, args.force)
+    finally:
+        nr.close_connections()
+
 if __name__ == "__main__":
     main()